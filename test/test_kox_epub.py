@@ -1,13 +1,26 @@
+from pathlib import Path
 import unittest
+import zipfile
 
 from koxformatconverter.kox_epub import ePubFile
 
+TEST_DATA_DIR = Path(__file__).parent / 'data'
+
 
 class TestKoxEpub(unittest.TestCase):
 
     def test_kox_epub(self):
-        epub_file = ePubFile(r'C:\TechDepot\Github\KoxFormatConverter\test\data\[Kox][非常家庭]卷01.kepub.epub')
-        cbz_file = epub_file.file_path.with_suffix('.cbz')
+        epub_file = TEST_DATA_DIR / '[Kox][非常家庭]卷01.kepub.epub'
+        cbz_file = epub_file.with_suffix('.cbz')
         if cbz_file.exists():
             cbz_file.unlink()
-        self.assertTrue(cbz_file.exists())
+        try:
+            converter = ePubFile(epub_file)
+            self.assertTrue(cbz_file.exists())
+            self.assertEqual(len(converter.image_files_in_order), 210)
+            with zipfile.ZipFile(cbz_file) as zf:
+                # 210 pages plus the cover, all named in page order
+                self.assertEqual(sorted(zf.namelist()), [f'{i:03d}.jpg' for i in range(211)])
+        finally:
+            if cbz_file.exists():
+                cbz_file.unlink()